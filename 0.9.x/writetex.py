@@ -24,6 +24,17 @@ WriteTexNS = u'http://wanglongqi.github.io/WriteTeX'
 # from textext
 SVG_NS = u"http://www.w3.org/2000/svg"
 XLINK_NS = u"http://www.w3.org/1999/xlink"
+# elements kept when converting pstoedit output to a group
+PSTOEDIT_TAGS = frozenset(('g', 'path', 'line'))
+# uniform scale plus translation applied to the inserted group
+MATRIX_TRANSFORM = 'matrix(%f,0,0,%f,%f,%f)'
+SVG_G_TAG = '{%s}g' % SVG_NS
+SVG_DEFS_TAG = '{%s}defs' % SVG_NS
+XLINK_HREF_ATTR = '{%s}href' % XLINK_NS
+# attribute holding the original TeX source on generated groups
+WRITETEX_TEXT_ATTR = '{%s}text' % WriteTexNS
+TRANSFORM_RE = re.compile(
+    r"(translate|scale|rotate|skewX|skewY|matrix)\s*\(([^)]*)\)\s*,?")
 
 
 class WriteTex(inkex.Effect):
@@ -85,21 +96,21 @@ class WriteTex(inkex.Effect):
         if action == "viewold":
             for i in self.options.ids:
                 node = self.selected[i]
-                if node.tag != '{%s}g' % SVG_NS:
+                if node.tag != SVG_G_TAG:
                     continue
-                if '{%s}text' % WriteTexNS in node.attrib:
+                if WRITETEX_TEXT_ATTR in node.attrib:
                     if self.options.tosvg == "true":
-                        doc = inkex.etree.fromstring(
-                            '<text x="%g" y="%g">%s</text>' % (
-                                self.view_center[0],
-                                self.view_center[1],
-                                node.attrib.get(
-                                    '{%s}text' % WriteTexNS, '').decode('string-escape')))
+                        doc = inkex.etree.Element('text')
+                        doc.attrib['x'] = '%g' % self.view_center[0]
+                        doc.attrib['y'] = '%g' % self.view_center[1]
+                        doc.text = node.attrib.get(
+                            WRITETEX_TEXT_ATTR, '').decode(
+                                'string-escape').decode('utf-8')
                         p = node.getparent()
                         p.append(doc)
                     else:
                         print(node.attrib.get(
-                            '{%s}text' % WriteTexNS, '').decode('string-escape'), file=sys.stderr)
+                            WRITETEX_TEXT_ATTR, '').decode('string-escape'), file=sys.stderr)
                     return
             print("No text find.", file=sys.stderr)
             return
@@ -213,7 +224,7 @@ class WriteTex(inkex.Effect):
 
             for child in svgin.iterchildren():
                 tag = child.tag.rsplit('}', 1)[-1]
-                if tag in ['g', 'path', 'line']:
+                if tag in PSTOEDIT_TAGS:
                     child = svg_to_group(self, child)
                     svgout.append(child)
 
@@ -224,23 +235,22 @@ class WriteTex(inkex.Effect):
         doc = inkex.etree.parse(svg_file)
         svg = doc.getroot()
         newnode = svg_to_group(self, svg)
-        newnode.attrib['{%s}text' %
-                       WriteTexNS] = self.text.encode('string-escape')
+        newnode.attrib[WRITETEX_TEXT_ATTR] = self.text.encode('string-escape')
 
         replace = False
 
         for i in self.options.ids:
             node = self.selected[i]
-            if node.tag != '{%s}g' % SVG_NS:
+            if node.tag != SVG_G_TAG:
                 continue
-            if '{%s}text' % WriteTexNS in node.attrib:
+            if WRITETEX_TEXT_ATTR in node.attrib:
                 replace = True
                 break
 
         if replace:
             try:
                 if self.options.rescale == 'true':
-                    newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+                    newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                         800*self.options.scale, 800*self.options.scale,
                         self.view_center[0],
                         self.view_center[1])
@@ -248,7 +258,7 @@ class WriteTex(inkex.Effect):
                     if 'transform' in node.attrib:
                         newnode.attrib['transform'] = node.attrib['transform']
                     else:
-                        newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+                        newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                             800*self.options.scale, 800*self.options.scale,
                             self.view_center[0],
                             self.view_center[1])
@@ -259,15 +269,15 @@ class WriteTex(inkex.Effect):
             p.remove(node)
             p.append(newnode)
         else:
-            newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+            newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                 800*self.options.scale, 800*self.options.scale,
                 self.view_center[0],
                 self.view_center[1])
             self.current_layer.append(newnode)
 
     def merge_pdf2svg_svg(self, svg_file):
-        # This is the smallest point coordinates assumed
-        MAX_XY = [-10000000, -10000000]
+        # Largest glyph offset seen while resolving references
+        MAX_XY = [float('-inf'), float('-inf')]
 
         def svg_to_group(self, svgin):
             target = {}
@@ -275,15 +285,16 @@ class WriteTex(inkex.Effect):
                 target['#'+node.attrib['id']] = node
 
             for node in svgin.xpath('//*'):
-                if ('{%s}href' % XLINK_NS) in node.attrib:
-                    href = node.attrib['{%s}href' % XLINK_NS]
+                if XLINK_HREF_ATTR in node.attrib:
+                    href = node.attrib[XLINK_HREF_ATTR]
                     p = node.getparent()
                     p.remove(node)
                     trans = 'translate(%s,%s)' % (
                         node.attrib['x'], node.attrib['y'])
+                    # same offset for every child of the referenced node
+                    x, y = self.parse_transform(trans)
                     for i in target[href].iterchildren():
                         i.attrib['transform'] = trans
-                        x, y = self.parse_transform(trans)
                         if x > MAX_XY[0]:
                             MAX_XY[0] = x
                         if y > MAX_XY[1]:
@@ -294,7 +305,7 @@ class WriteTex(inkex.Effect):
             for node in svgin:
                 if node is svgout:
                     continue
-                if node.tag == '{%s}defs' % SVG_NS:
+                if node.tag == SVG_DEFS_TAG:
                     continue
                 svgout.append(node)
             return svgout
@@ -302,23 +313,25 @@ class WriteTex(inkex.Effect):
         doc = inkex.etree.parse(svg_file)
         svg = doc.getroot()
         newnode = svg_to_group(self, svg)
-        newnode.attrib['{%s}text' %
-                       WriteTexNS] = self.text.encode('string-escape')
+        if MAX_XY[0] == float('-inf'):
+            # No glyph was referenced, so there is no offset to remove
+            MAX_XY[:] = [0, 0]
+        newnode.attrib[WRITETEX_TEXT_ATTR] = self.text.encode('string-escape')
 
         replace = False
 
         for i in self.options.ids:
             node = self.selected[i]
-            if node.tag != '{%s}g' % SVG_NS:
+            if node.tag != SVG_G_TAG:
                 continue
-            if '{%s}text' % WriteTexNS in node.attrib:
+            if WRITETEX_TEXT_ATTR in node.attrib:
                 replace = True
                 break
 
         if replace:
             try:
                 if self.options.rescale == 'true':
-                    newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+                    newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                         self.options.scale, self.options.scale,
                         self.view_center[0],
                         self.view_center[1])
@@ -326,7 +339,7 @@ class WriteTex(inkex.Effect):
                     if 'transform' in node.attrib:
                         newnode.attrib['transform'] = node.attrib['transform']
                     else:
-                        newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+                        newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                             self.options.scale, self.options.scale,
                             self.view_center[0]-MAX_XY[0]*self.options.scale,
                             self.view_center[1]-MAX_XY[1]*self.options.scale)
@@ -338,7 +351,7 @@ class WriteTex(inkex.Effect):
             p.append(newnode)
         else:
             self.current_layer.append(newnode)
-            newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+            newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                 self.options.scale, self.options.scale,
                 self.view_center[0]-MAX_XY[0]*self.options.scale,
                 self.view_center[1]-MAX_XY[1]*self.options.scale)
@@ -348,9 +361,7 @@ class WriteTex(inkex.Effect):
         if transf == "" or transf is None:
             return(0, 0)
         stransf = transf.strip()
-        result = re.match(
-            r"(translate|scale|rotate|skewX|skewY|matrix)\s*\(([^)]*)\)\s*,?",
-            stransf)
+        result = TRANSFORM_RE.match(stransf)
         if result.group(1) == "translate":
             args = result.group(2).replace(',', ' ').split()
             dx = float(args[0])
@@ -25,6 +25,17 @@ WriteTexNS = u'http://wanglongqi.github.io/WriteTeX'
 # from textext
 SVG_NS = u"http://www.w3.org/2000/svg"
 XLINK_NS = u"http://www.w3.org/1999/xlink"
+# elements kept when converting pstoedit output to a group
+PSTOEDIT_TAGS = frozenset(('g', 'path', 'line'))
+# uniform scale plus translation applied to the inserted group
+MATRIX_TRANSFORM = 'matrix(%f,0,0,%f,%f,%f)'
+SVG_G_TAG = '{%s}g' % SVG_NS
+SVG_DEFS_TAG = '{%s}defs' % SVG_NS
+XLINK_HREF_ATTR = '{%s}href' % XLINK_NS
+# attribute holding the original TeX source on generated groups
+WRITETEX_TEXT_ATTR = '{%s}text' % WriteTexNS
+TRANSFORM_RE = re.compile(
+    r"(translate|scale|rotate|skewX|skewY|matrix)\s*\(([^)]*)\)\s*,?")
 
 
 class WriteTex(inkex.Effect):
@@ -86,21 +97,20 @@ class WriteTex(inkex.Effect):
         if action == "viewold":
             for i in self.options.ids:
                 node = self.svg.selected[i]
-                if node.tag != '{%s}g' % SVG_NS:
+                if node.tag != SVG_G_TAG:
                     continue
-                if '{%s}text' % WriteTexNS in node.attrib:
+                if WRITETEX_TEXT_ATTR in node.attrib:
                     if self.options.tosvg == "true":
-                        doc = etree.fromstring(
-                            '<text x="%g" y="%g">%s</text>' % (
-                                self.svg.namedview.center[0],
-                                self.svg.namedview.center[1],
-                                node.attrib.get(
-                                    '{%s}text' % WriteTexNS, '')))
+                        doc = etree.Element('text')
+                        doc.attrib['x'] = '%g' % self.svg.namedview.center[0]
+                        doc.attrib['y'] = '%g' % self.svg.namedview.center[1]
+                        doc.text = node.attrib.get(
+                            WRITETEX_TEXT_ATTR, '')
                         p = node.getparent()
                         p.append(doc)
                     else:
                         print(node.attrib.get(
-                            '{%s}text' % WriteTexNS, ''), file=sys.stderr)
+                            WRITETEX_TEXT_ATTR, ''), file=sys.stderr)
                     return
             print("No text find.", file=sys.stderr)
             return
@@ -217,7 +227,7 @@ class WriteTex(inkex.Effect):
 
             for child in svgin.iterchildren():
                 tag = child.tag.rsplit('}', 1)[-1]
-                if tag in ['g', 'path', 'line']:
+                if tag in PSTOEDIT_TAGS:
                     child = svg_to_group(self, child)
                     svgout.append(child)
 
@@ -228,23 +238,22 @@ class WriteTex(inkex.Effect):
         doc = etree.parse(svg_file)
         svg = doc.getroot()
         newnode = svg_to_group(self, svg)
-        newnode.attrib['{%s}text' %
-                       WriteTexNS] = self.text
+        newnode.attrib[WRITETEX_TEXT_ATTR] = self.text
 
         replace = False
 
         for i in self.options.ids:
             node = self.svg.selected[i]
-            if node.tag != '{%s}g' % SVG_NS:
+            if node.tag != SVG_G_TAG:
                 continue
-            if '{%s}text' % WriteTexNS in node.attrib:
+            if WRITETEX_TEXT_ATTR in node.attrib:
                 replace = True
                 break
 
         if replace:
             try:
                 if self.options.rescale == 'true':
-                    newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+                    newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                         800*self.options.scale, 800*self.options.scale,
                         self.svg.namedview.center[0],
                         self.svg.namedview.center[1])
@@ -252,7 +261,7 @@ class WriteTex(inkex.Effect):
                     if 'transform' in node.attrib:
                         newnode.attrib['transform'] = node.attrib['transform']
                     else:
-                        newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+                        newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                             800*self.options.scale, 800*self.options.scale,
                             self.svg.namedview.center[0],
                             self.svg.namedview.center[1])
@@ -263,15 +272,15 @@ class WriteTex(inkex.Effect):
             p.remove(node)
             p.append(newnode)
         else:
-            newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+            newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                 800*self.options.scale, 800*self.options.scale,
                 self.svg.namedview.center[0],
                 self.svg.namedview.center[1])
             self.svg.get_current_layer().append(newnode)
 
     def merge_pdf2svg_svg(self, svg_file):
-        # This is the smallest point coordinates assumed
-        MAX_XY = [-10000000, -10000000]
+        # Largest glyph offset seen while resolving references
+        MAX_XY = [float('-inf'), float('-inf')]
 
         def svg_to_group(self, svgin):
             target = {}
@@ -279,15 +288,16 @@ class WriteTex(inkex.Effect):
                 target['#'+node.attrib['id']] = node
 
             for node in svgin.xpath('//*'):
-                if ('{%s}href' % XLINK_NS) in node.attrib:
-                    href = node.attrib['{%s}href' % XLINK_NS]
+                if XLINK_HREF_ATTR in node.attrib:
+                    href = node.attrib[XLINK_HREF_ATTR]
                     p = node.getparent()
                     p.remove(node)
                     trans = 'translate(%s,%s)' % (
                         node.attrib['x'], node.attrib['y'])
+                    # same offset for every child of the referenced node
+                    x, y = self.parse_transform(trans)
                     for i in target[href].iterchildren():
                         i.attrib['transform'] = trans
-                        x, y = self.parse_transform(trans)
                         if x > MAX_XY[0]:
                             MAX_XY[0] = x
                         if y > MAX_XY[1]:
@@ -298,7 +308,7 @@ class WriteTex(inkex.Effect):
             for node in svgin:
                 if node is svgout:
                     continue
-                if node.tag == '{%s}defs' % SVG_NS:
+                if node.tag == SVG_DEFS_TAG:
                     continue
                 svgout.append(node)
             return svgout
@@ -306,23 +316,25 @@ class WriteTex(inkex.Effect):
         doc = etree.parse(svg_file)
         svg = doc.getroot()
         newnode = svg_to_group(self, svg)
-        newnode.attrib['{%s}text' %
-                       WriteTexNS] = self.text
+        if MAX_XY[0] == float('-inf'):
+            # No glyph was referenced, so there is no offset to remove
+            MAX_XY[:] = [0, 0]
+        newnode.attrib[WRITETEX_TEXT_ATTR] = self.text
 
         replace = False
 
         for i in self.options.ids:
             node = self.svg.selected[i]
-            if node.tag != '{%s}g' % SVG_NS:
+            if node.tag != SVG_G_TAG:
                 continue
-            if '{%s}text' % WriteTexNS in node.attrib:
+            if WRITETEX_TEXT_ATTR in node.attrib:
                 replace = True
                 break
 
         if replace:
             try:
                 if self.options.rescale == 'true':
-                    newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+                    newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                         self.options.scale, self.options.scale,
                         self.svg.namedview.center[0],
                         self.svg.namedview.center[1])
@@ -330,7 +342,7 @@ class WriteTex(inkex.Effect):
                     if 'transform' in node.attrib:
                         newnode.attrib['transform'] = node.attrib['transform']
                     else:
-                        newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+                        newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                             self.options.scale, self.options.scale,
                             self.svg.namedview.center[0]-MAX_XY[0]*self.options.scale,
                             self.svg.namedview.center[1]-MAX_XY[1]*self.options.scale)
@@ -342,7 +354,7 @@ class WriteTex(inkex.Effect):
             p.append(newnode)
         else:
             self.svg.get_current_layer().append(newnode)
-            newnode.attrib['transform'] = 'matrix(%f,0,0,%f,%f,%f)' % (
+            newnode.attrib['transform'] = MATRIX_TRANSFORM % (
                 self.options.scale, self.options.scale,
                 self.svg.namedview.center[0]-MAX_XY[0]*self.options.scale,
                 self.svg.namedview.center[1]-MAX_XY[1]*self.options.scale)
@@ -352,9 +364,7 @@ class WriteTex(inkex.Effect):
         if transf == "" or transf is None:
             return(0, 0)
         stransf = transf.strip()
-        result = re.match(
-            r"(translate|scale|rotate|skewX|skewY|matrix)\s*\(([^)]*)\)\s*,?",
-            stransf)
+        result = TRANSFORM_RE.match(stransf)
         if result.group(1) == "translate":
             args = result.group(2).replace(',', ' ').split()
             dx = float(args[0])